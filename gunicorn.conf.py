@@ -0,0 +1,11 @@
+import os
+
+# 生产环境启动配置：gunicorn -c gunicorn.conf.py main:app
+# 每个 worker 是一个独立的 uvicorn 进程（自动使用 uvloop + httptools）
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+# 写回环境变量，fork 出的 worker 据此把 DASHSCOPE_RPS / TAVILY_RPS 按进程数均分
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# 不输出访问日志，减少每个请求的日志开销；错误日志仍输出到 stderr
+accesslog = None
+errorlog = "-"
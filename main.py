@@ -1,327 +1,547 @@
 import os
-import json
+import math
+import time
+import asyncio
+from collections import Counter
+import httpx
+import numpy as np
+import msgspec
 import uvicorn
+from cachetools import TLRUCache, TTLCache
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
 from http import HTTPStatus
 
 # ================= 配置区域 =================
 # 在这里填入你的 Key，或者设置到环境变量中
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY") # 阿里云百炼/DashScope Key
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+CACHE_TTL = int(os.getenv("CACHE_TTL", 900))  # 分析结果缓存时间（秒）
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 1024))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))  # 语义缓存命中的余弦相似度阈值
+SEARCH_CONTENT_MAX_CHARS = int(os.getenv("SEARCH_CONTENT_MAX_CHARS", 500))  # 每条搜索结果写入 Prompt 的最大字数
+# 以下两项是整个服务（所有 worker 合计）每秒最多发起的请求数，<= 0 表示不限流
+DASHSCOPE_RPS = float(os.getenv("DASHSCOPE_RPS", 5))
+TAVILY_RPS = float(os.getenv("TAVILY_RPS", 1))  # Tavily 免费额度约 1 次/秒
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))  # worker 进程数，gunicorn.conf.py 会设置同一变量
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", 20))  # 后台预刷新的热门话题数量，0 表示关闭
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", 60))  # 后台预刷新的检查间隔（秒）
+# 允许跨域访问的前端地址，多个用逗号分隔；页面由本服务同源提供时无需配置
+CORS_ALLOW_ORIGINS = [o.strip() for o in os.getenv("CORS_ALLOW_ORIGINS", "*").split(",") if o.strip()]
 # ===========================================
 
 # 初始化库
 import dashscope
-from tavily import TavilyClient
+from dashscope.aigc.generation import AioGeneration
 
+# 没有 DashScope Key 时服务无法工作，启动时直接报错，而不是等第一个请求超时/报错才发现
+if not DASHSCOPE_API_KEY:
+    raise RuntimeError("DASHSCOPE_API_KEY 未设置，请先配置环境变量再启动服务。")
 dashscope.api_key = DASHSCOPE_API_KEY
-tavily = None
-try:
-    if TAVILY_API_KEY:
-        tavily = TavilyClient(api_key=TAVILY_API_KEY)
-    else:
-        print("⚠️ 警告：TAVILY_API_KEY 未设置，搜索功能将不可用（程序可继续运行以便调试）。")
-except Exception as e:
-    print("⚠️ 初始化 TavilyClient 失败：", e)
-    tavily = None
-
-app = FastAPI()
+if not TAVILY_API_KEY:
+    print("⚠️ 警告：TAVILY_API_KEY 未设置，搜索功能将不可用（程序可继续运行以便调试）。")
+
+class AsyncRateLimiter:
+    """令牌桶限流：平均每秒放行 rate_per_sec 个请求，最多允许 burst 个突发，超出的请求在本地排队等待。"""
+
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = rate_per_sec
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # 持锁等待令牌，保证排队的请求按到达顺序放行
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """有空闲令牌时立即取走并返回 True，否则不等待、直接返回 False。"""
+        if self.rate <= 0:
+            return True
+        # 已有请求在排队时不插队
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+def per_worker_limiter(total_rps: float) -> AsyncRateLimiter:
+    # 限流器在每个进程内独立计数，按 worker 数均分总速率，多进程合计才不会超过配置值
+    rate = total_rps / max(1, WEB_CONCURRENCY)
+    return AsyncRateLimiter(rate, burst=max(1, math.ceil(rate)))
+
+# 主动限流，避免突发流量触发服务商 429 后进入缓慢的重试退避
+dashscope_limiter = per_worker_limiter(DASHSCOPE_RPS)
+tavily_limiter = per_worker_limiter(TAVILY_RPS)
+
+# Tavily SDK 没有原生异步接口，直接用 httpx 异步调用其 REST API，避免阻塞事件循环
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+# 所有对外 HTTP 请求共用一个客户端：复用连接池省去重复的 TCP/TLS 握手，服务端支持时走 HTTP/2 多路复用
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+)
+
+class MsgspecJSONResponse(JSONResponse):
+    """用 msgspec 序列化响应，可直接编码 msgspec.Struct，报告正文较大时比标准库 json 快得多。
+
+    返回 Struct 的接口需显式构造本响应，FastAPI 的 jsonable_encoder 不认识 Struct。
+    """
+
+    def render(self, content) -> bytes:
+        return msgspec.json.encode(content)
+
+app = FastAPI(default_response_class=MsgspecJSONResponse)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# 允许跨域
+# 压缩较大的响应（前端页面、批量分析结果等）；Starlette 0.46 起会自动跳过 text/event-stream（requirements 中 fastapi>=0.143.0 保证这一点）
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# 允许跨域：只放行实际用到的方法和请求头，并让浏览器缓存预检结果，避免每次 POST 前都多一次 OPTIONS 往返
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+    max_age=86400,
 )
 
 class TopicRequest(BaseModel):
     topic: str
 
-# --- 核心 Agent 逻辑 ---
-def get_sentiment_analysis(topic: str):
+# 单次批量分析最多接受的话题数，超出时直接返回 422，避免一次请求占满限流配额
+BATCH_MAX_TOPICS = 20
+
+class BatchTopicRequest(BaseModel):
+    topics: list[str] = Field(max_length=BATCH_MAX_TOPICS)
+
+# 模型输出的 JSON 结构，解码时由 msgspec 一并完成类型校验
+class TrendPoint(msgspec.Struct):
+    date: str
+    score: int
+
+class AnalysisResult(msgspec.Struct):
+    sentiment_score: int
+    sentiment_label: str
+    keywords: list[str]
+    trend_data: list[TrendPoint]
+    report_markdown: str
+
+# 批量分析时限制同时进行的分析数量，避免触发 DashScope 限流
+BATCH_CONCURRENCY = 8
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+async def tavily_search(query: str, search_depth: str = "advanced", max_results: int = 5, acquired: bool = False):
+    # acquired=True 表示调用方已通过 tavily_limiter.try_acquire() 取得令牌
+    if not TAVILY_API_KEY:
+        raise RuntimeError("TAVILY_API_KEY 未设置")
+    if not acquired:
+        await tavily_limiter.acquire()
+    resp = await http_client.post(
+        TAVILY_SEARCH_URL,
+        headers={"Authorization": f"Bearer {TAVILY_API_KEY}"},
+        json={"query": query, "search_depth": search_depth, "max_results": max_results},
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+# --- 结果缓存 ---
+# 第一层：按规范化 topic 精确匹配的 TTL 缓存；第二层：按 topic 向量余弦相似度匹配的语义缓存
+PARSE_ERROR_LABEL = "解析错误"
+_cached_at = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)  # 各缓存结果的写入时间，供后台预刷新判断是否快要过期
+# 过期时间按结果自身的写入时间计算：语义命中记下的别名沿用原结果的写入时间，不会比原结果活得更久
+result_cache = TLRUCache(
+    maxsize=CACHE_MAXSIZE,
+    ttu=lambda key, _value, now: _cached_at.get(key, now) + CACHE_TTL,
+)
+_inflight: dict[str, asyncio.Future] = {}
+
+# 话题请求计数（定期衰减），用于找出需要后台预刷新的热门话题
+topic_counter = Counter()
+_topic_names: dict[str, str] = {}
+
+def cache_key(topic: str) -> str:
+    return topic.strip().lower()
+
+def cache_result(key: str, result, vector=None, cached_at=None):
+    if result.sentiment_label == PARSE_ERROR_LABEL:
+        return
+    # 先记写入时间，result_cache 的 ttu 据此计算过期时间
+    _cached_at[key] = time.monotonic() if cached_at is None else cached_at
+    result_cache[key] = result
+    if vector is not None:
+        semantic_cache.add(key, vector)
+
+class SemanticCache:
+    """保存已缓存话题的单位化向量，查找与新话题最相似、且结果仍在 results 中的缓存 key。"""
+
+    def __init__(self, results, threshold: float):
+        self.results = results
+        self.threshold = threshold
+        self.keys: list[str] = []
+        self.vectors = None
+
+    def lookup(self, vector):
+        if self.vectors is None or not self.keys:
+            return None
+        sims = self.vectors @ vector
+        # 按相似度从高到低检查，跳过结果已过期的 key，避免过期的最近邻挡住仍有效的次近邻
+        for i in np.argsort(sims)[::-1]:
+            if sims[i] < self.threshold:
+                break
+            if self.keys[i] in self.results:
+                return self.keys[i]
+        return None
+
+    def add(self, key: str, vector):
+        # 顺带清理结果已过期的向量，矩阵规模不会超过结果缓存本身
+        alive = [i for i, k in enumerate(self.keys) if k in self.results and k != key]
+        self.keys = [self.keys[i] for i in alive] + [key]
+        if self.vectors is None or not alive:
+            self.vectors = vector[np.newaxis, :]
+        else:
+            self.vectors = np.vstack([self.vectors[alive], vector])
+
+semantic_cache = SemanticCache(result_cache, SEMANTIC_CACHE_THRESHOLD)
+
+async def embed_topic(topic: str):
+    # DashScope 的 TextEmbedding 只有同步接口，放到线程池中执行
+    try:
+        async with dashscope_limiter:
+            resp = await asyncio.to_thread(
+                dashscope.TextEmbedding.call,
+                model=dashscope.TextEmbedding.Models.text_embedding_v2,
+                input=topic,
+            )
+    except Exception as e:
+        print(f"Embedding Error: {e}")
+        return None
+    if resp.status_code != HTTPStatus.OK:
+        print(f"Embedding Error: {resp.message}")
+        return None
+    vector = np.asarray(resp.output["embeddings"][0]["embedding"], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+async def search_context(topic: str, acquired: bool = False) -> str:
     print(f"🕵️ 正在搜索关于: {topic} ...")
-    
-    # 1. 使用 Tavily 搜索最新资讯
     try:
-        search_result = tavily.search(query=f"{topic} 最新评论 争议 事件分析", search_depth="advanced", max_results=5)
-        context = "\n".join([f"- [{res['title']}]({res['url']}): {res['content']}" for res in search_result['results']])
+        search_result = await tavily_search(
+            f"{topic} 最新评论 争议 事件分析", search_depth="advanced", max_results=5, acquired=acquired
+        )
+        # 只保留标题和截断后的正文：上下文越短，Prompt token 越少，模型响应越快、费用越低
+        return "\n".join(f"- {res['title']}: {res['content'][:SEARCH_CONTENT_MAX_CHARS]}" for res in search_result['results'])
     except Exception as e:
         print(f"Search Error: {e}")
-        context = "搜索失败，仅基于模型知识库分析。"
+        return "搜索失败，仅基于模型知识库分析。"
 
-    print("🧠 模型正在思考...")
-    
-    # 2. 构建 Prompt，强制要求返回 JSON 格式以便前端渲染图表
-    prompt = f"""
-    你是一个高级舆情分析专家。请根据以下互联网搜索结果，对话题“{topic}”进行深度分析。
+# --- 核心 Agent 逻辑 ---
+async def stream_sentiment_analysis(topic: str, refresh: bool = False):
+    """依次产出 ("delta", 模型输出片段)，最后产出 ("result", 分析结果)；命中缓存时只产出 result。
+
+    refresh=True（后台预刷新）时跳过两层缓存查找、重新分析，但仍走 single-flight。
+    """
+    key = cache_key(topic)
+    if not refresh:
+        # 计数只由后台预刷新衰减清理，关闭预刷新时不计数，避免每个不同话题都永久占用内存
+        if PREFETCH_TOP_N > 0:
+            topic_counter[key] += 1
+            _topic_names[key] = topic.strip()
+        if key in result_cache:
+            yield "result", result_cache[key]
+            return
+
+    # single-flight：同一 topic 已有请求在分析时，直接等待它的结果，避免重复调用上游接口。
+    # 查询与登记 _inflight 之间没有 await，在事件循环内天然是原子的，无需额外加锁
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        # shield 防止某个等待方断开连接时把共享的 Future 一起取消
+        yield "result", await asyncio.shield(inflight)
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    # 没有等待方时也读取一次异常，避免 asyncio 报 "exception was never retrieved"
+    future.add_done_callback(lambda f: f.exception())
+    _inflight[key] = future
+    # 精确缓存未命中时，若 Tavily 限流器有空闲令牌，搜索与 embedding + 语义缓存查找并发进行（语义命中则取消搜索，
+    # 但令牌已消耗）；没有空闲令牌时等语义缓存未命中后再排队搜索，避免语义命中的请求占用限流名额
+    search_task = None
+    if tavily_limiter.try_acquire():
+        search_task = asyncio.create_task(search_context(topic, acquired=True))
+    try:
+        vector = await embed_topic(topic)
+        if vector is not None and not refresh:
+            similar_key = semantic_cache.lookup(vector)
+            if similar_key is not None and similar_key in result_cache:
+                print(f"♻️ 命中语义缓存: {topic} ≈ {similar_key}")
+                if search_task is not None:
+                    search_task.cancel()
+                result = result_cache[similar_key]
+                # 以自身 key 记下别名并沿用原写入时间：之后可精确命中，且与原结果同时过期；
+                # 不登记向量，别名不会成为语义近邻，避免结果沿着 A≈B≈C 逐级漂移到并不相似的话题
+                cache_result(key, result, cached_at=_cached_at.get(similar_key))
+                future.set_result(result)
+                yield "result", result
+                return
+
+        result = None
+        context = await (search_task if search_task is not None else search_context(topic))
+        async for event, data in run_sentiment_analysis(topic, context):
+            if event == "result":
+                result = data
+            else:
+                yield event, data
+        cache_result(key, result, vector)
+        future.set_result(result)
+        yield "result", result
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+        raise
+    finally:
+        if search_task is not None:
+            search_task.cancel()
+        _inflight.pop(key, None)
+        if not future.done():
+            # 发起请求的客户端中途断开，通知其余等待方重试
+            future.set_exception(HTTPException(status_code=503, detail="分析已中断，请重试"))
+
+async def get_sentiment_analysis(topic: str, refresh: bool = False):
+    # 不需要流式输出的调用方（如批量接口、后台预刷新）只取最终结果；完整消费生成器以确保 _inflight 记录被及时清理
+    result = None
+    async for event, data in stream_sentiment_analysis(topic, refresh=refresh):
+        if event == "result":
+            result = data
+    return result
+
+# Prompt 模板在导入时拼好，请求时只需插入 topic 与搜索上下文；强制要求返回 JSON 格式以便前端渲染图表
+_PROMPT_HEAD = """
+    你是一个高级舆情分析专家。请根据以下互联网搜索结果，对话题“"""
+_PROMPT_MID = """”进行深度分析。
     
     搜索结果上下文：
-    {context}
+    """
+_PROMPT_TAIL = """
 
     请必须以严格的 JSON 格式输出，不要包含 Markdown 代码块标记（如 ```json），直接返回 JSON 字符串。
     JSON 结构要求如下：
-    {{
+    {
         "sentiment_score": 0-100的整数 (0为极度负面，50中立，100极度正面),
         "sentiment_label": "正面/负面/中立/争议",
         "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词5"],
         "trend_data": [
-            {{"date": "最近5天的日期1", "score": 预估热度值0-100}},
-            {{"date": "最近5天的日期2", "score": 预估热度值0-100}},
+            {"date": "最近5天的日期1", "score": 预估热度值0-100},
+            {"date": "最近5天的日期2", "score": 预估热度值0-100},
             ...
         ],
         "report_markdown": "这里是一篇结构清晰、排版精美的深度分析报告（Markdown格式）。请包含：事件背景、各方观点、情感分析结论、未来走势预测。请使用emoji修饰标题。"
-    }}
+    }
     """
 
-    # 3. 调用千问 (Qwen-Plus 或 Qwen-Max)
-    response = dashscope.Generation.call(
-        model=dashscope.Generation.Models.qwen_plus,
-        prompt=prompt,
-        result_format='message',  
-    )
+async def run_sentiment_analysis(topic: str, context: str = None):
+    # 1. 使用 Tavily 搜索最新资讯（调用方可传入已并发取得的搜索结果）
+    if context is None:
+        context = await search_context(topic)
+    print("🧠 模型正在思考...")
 
-    if response.status_code == HTTPStatus.OK:
-        content = response.output.choices[0].message.content
-        # 简单的清洗，防止模型偶尔加 markdown 标记
-        content = content.replace("```json", "").replace("```", "").strip()
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # Fallback 如果模型没返回 JSON
-            return {
-                "sentiment_score": 50,
-                "sentiment_label": "解析错误",
-                "keywords": ["Error"],
-                "trend_data": [],
-                "report_markdown": f"解析模型输出失败，原始输出：\n{content}"
-            }
-    else:
-        raise HTTPException(status_code=500, detail=f"Model Error: {response.message}")
+    # 2. 构建 Prompt（f-string 在 CPython 中编译为一次 BUILD_STRING 拼接）
+    prompt = f"{_PROMPT_HEAD}{topic}{_PROMPT_MID}{context}{_PROMPT_TAIL}"
+
+    # 3. 调用千问 (Qwen-Plus 或 Qwen-Max)，流式返回增量输出
+    async with dashscope_limiter:
+        responses = await AioGeneration.call(
+            model=dashscope.Generation.Models.qwen_plus,
+            prompt=prompt,
+            result_format='message',
+            # JSON Mode：由服务端保证输出为合法 JSON，无需再清洗 markdown 代码块标记
+            response_format={"type": "json_object"},
+            stream=True,
+            incremental_output=True,
+        )
+
+    parts = []
+    async for response in responses:
+        if response.status_code != HTTPStatus.OK:
+            raise HTTPException(status_code=500, detail=f"Model Error: {response.message}")
+        delta = response.output.choices[0].message.content
+        if delta:
+            parts.append(delta)
+            yield "delta", delta
+
+    # 解析与校验放到线程池执行，报告变长时也不会占住事件循环、拖慢其他并发请求
+    yield "result", await asyncio.to_thread(parse_model_output, "".join(parts))
+
+def parse_model_output(content: str) -> AnalysisResult:
+    try:
+        # strict=False 允许 "80"、80.0 这类可无损转换的值，减少因模型输出细节导致的解析失败
+        return msgspec.json.decode(content, type=AnalysisResult, strict=False)
+    except msgspec.DecodeError:
+        # Fallback 兜底：输出被截断或字段不符合结构时仍可能解析失败
+        return AnalysisResult(
+            sentiment_score=50,
+            sentiment_label=PARSE_ERROR_LABEL,
+            keywords=["Error"],
+            trend_data=[],
+            report_markdown=f"解析模型输出失败，原始输出：\n{content}",
+        )
 
 # --- API 接口 ---
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {msgspec.json.encode(data).decode()}\n\n"
+
 @app.post("/api/analyze")
 async def analyze_sentiment(request: TopicRequest):
-    data = get_sentiment_analysis(request.topic)
-    return data
-
-# --- 前端页面 (直接嵌入) ---
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    return """
-<!DOCTYPE html>
-<html lang="zh-CN" class="dark">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>AI 舆情分析系统</title>
-    <!-- Tailwind CSS -->
-    <script src="https://cdn.tailwindcss.com"></script>
-    <!-- Vue 3 -->
-    <script src="https://unpkg.com/vue@3/dist/vue.global.js"></script>
-    <!-- ECharts -->
-    <script src="https://cdn.jsdelivr.net/npm/echarts@5.4.3/dist/echarts.min.js"></script>
-    <!-- Markdown Parser -->
-    <script src="https://cdn.jsdelivr.net/npm/markdown-it@13.0.2/dist/markdown-it.min.js"></script>
-    
-    <script>
-        tailwind.config = {
-            darkMode: 'class',
-            theme: {
-                extend: {
-                    colors: {
-                        primary: '#6366f1',
-                        darkbg: '#0f172a',
-                        cardbg: '#1e293b'
-                    }
-                }
-            }
-        }
-    </script>
-    <style>
-        body { background-color: #0f172a; color: #e2e8f0; font-family: 'Inter', sans-serif; }
-        .glass { background: rgba(30, 41, 59, 0.7); backdrop-filter: blur(10px); border: 1px solid rgba(255,255,255,0.1); }
-        .markdown-body h1 { font-size: 1.5rem; font-weight: bold; margin-top: 1rem; color: #818cf8; }
-        .markdown-body h2 { font-size: 1.25rem; font-weight: bold; margin-top: 1rem; color: #a5b4fc; }
-        .markdown-body p { margin-bottom: 0.8rem; line-height: 1.6; color: #cbd5e1; }
-        .markdown-body li { margin-left: 1.2rem; list-style-type: disc; }
-        .loader { border: 4px solid #f3f3f3; border-top: 4px solid #6366f1; border-radius: 50%; width: 30px; height: 30px; animation: spin 1s linear infinite; }
-        @keyframes spin { 0% { transform: rotate(0deg); } 100% { transform: rotate(360deg); } }
-    </style>
-</head>
-<body class="min-h-screen p-6">
-    <div id="app" class="max-w-6xl mx-auto">
-        <!-- Header -->
-        <header class="mb-10 text-center">
-            <h1 class="text-4xl font-extrabold text-transparent bg-clip-text bg-gradient-to-r from-indigo-400 to-cyan-400 mb-2">
-                自媒体网络舆情事件分析系统
-            </h1>
-            <p class="text-slate-400">西藏大学-上海大学多媒体与人工智能安全研究小组</p>
-        </header>
-
-        <!-- Input Area -->
-        <div class="max-w-2xl mx-auto mb-12 glass rounded-2xl p-2 flex shadow-2xl shadow-indigo-500/20">
-            <input 
-                v-model="topic" 
-                @keyup.enter="analyze"
-                type="text" 
-                placeholder="输入话题，例如：'小米SU7发布会' 或 'OpenAI新模型'" 
-                class="flex-1 bg-transparent border-none outline-none text-white px-4 text-lg placeholder-slate-500"
-            >
-            <button 
-                @click="analyze" 
-                :disabled="loading"
-                class="bg-primary hover:bg-indigo-600 text-white px-8 py-3 rounded-xl font-medium transition-all flex items-center gap-2"
-            >
-                <span v-if="!loading">生成报告</span>
-                <div v-else class="loader"></div>
-            </button>
-        </div>
-
-        <!-- Dashboard -->
-        <div v-if="result" class="grid grid-cols-1 md:grid-cols-3 gap-6 animate-fade-in-up">
-            
-            <!-- Left Column: Metrics -->
-            <div class="space-y-6">
-                <!-- Score Card -->
-                <div class="glass rounded-2xl p-6 text-center relative overflow-hidden">
-                    <div class="text-slate-400 text-sm uppercase tracking-wider mb-2">情感指数</div>
-                    <div class="text-6xl font-bold" :class="getScoreColor(result.sentiment_score)">
-                        {{ result.sentiment_score }}
-                    </div>
-                    <div class="text-xl mt-2 font-medium text-white">{{ result.sentiment_label }}</div>
-                    <!-- Background Glow -->
-                    <div class="absolute top-1/2 left-1/2 -translate-x-1/2 -translate-y-1/2 w-32 h-32 bg-indigo-500/20 blur-3xl -z-10"></div>
-                </div>
-
-                <!-- Keywords -->
-                <div class="glass rounded-2xl p-6">
-                    <div class="text-slate-400 text-sm uppercase tracking-wider mb-4">舆论关键词</div>
-                    <div class="flex flex-wrap gap-2">
-                        <span v-for="word in result.keywords" class="px-3 py-1 bg-slate-700/50 rounded-full text-sm text-indigo-300 border border-indigo-500/30">
-                            #{{ word }}
-                        </span>
-                    </div>
-                </div>
-
-                <!-- Trend Chart Container -->
-                <div class="glass rounded-2xl p-6 h-64">
-                    <div class="text-slate-400 text-sm uppercase tracking-wider mb-2">热度趋势</div>
-                    <div id="trendChart" class="w-full h-full"></div>
-                </div>
-            </div>
-
-            <!-- Right Column: Report -->
-            <div class="md:col-span-2 glass rounded-2xl p-8 min-h-[600px]">
-                <div class="flex items-center justify-between mb-6 border-b border-slate-700 pb-4">
-                    <h2 class="text-2xl font-bold text-white">深度分析报告</h2>
-                    <span class="text-xs text-slate-500 bg-slate-800 px-2 py-1 rounded">AI Generated</span>
-                </div>
-                <div class="markdown-body text-slate-300" v-html="renderedMarkdown"></div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        const { createApp, ref, computed, nextTick } = Vue;
-
-        createApp({
-            setup() {
-                const topic = ref('');
-                const loading = ref(false);
-                const result = ref(null);
-                const mdParser = window.markdownit();
-
-                const analyze = async () => {
-                    if (!topic.value) return;
-                    loading.value = true;
-                    result.value = null;
-
-                    try {
-                        const res = await fetch('/api/analyze', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ topic: topic.value })
-                        });
-                        const data = await res.json();
-                        result.value = data;
-                        
-                        // Wait for DOM update then render chart
-                        await nextTick();
-                        initChart(data.trend_data);
-                    } catch (e) {
-                        alert('分析失败，请检查后端日志');
-                    } finally {
-                        loading.value = false;
-                    }
-                };
-
-                const renderedMarkdown = computed(() => {
-                    return result.value ? mdParser.render(result.value.report_markdown) : '';
-                });
-
-                const getScoreColor = (score) => {
-                    if (score >= 70) return 'text-emerald-400';
-                    if (score >= 40) return 'text-yellow-400';
-                    return 'text-rose-400';
-                };
-
-                const initChart = (data) => {
-                    if (!data || data.length === 0) return;
-                    const chart = echarts.init(document.getElementById('trendChart'));
-                    chart.setOption({
-                        grid: { top: 10, bottom: 20, left: 30, right: 10 },
-                        tooltip: { trigger: 'axis' },
-                        xAxis: { 
-                            type: 'category', 
-                            data: data.map(i => i.date),
-                            axisLine: { lineStyle: { color: '#64748b' } }
-                        },
-                        yAxis: { 
-                            type: 'value', 
-                            splitLine: { lineStyle: { color: '#334155' } },
-                            axisLine: { show: false },
-                            axisLabel: { color: '#64748b' }
-                        },
-                        series: [{
-                            data: data.map(i => i.score),
-                            type: 'line',
-                            smooth: true,
-                            lineStyle: { color: '#6366f1', width: 3 },
-                            areaStyle: {
-                                color: new echarts.graphic.LinearGradient(0, 0, 0, 1, [
-                                    { offset: 0, color: 'rgba(99, 102, 241, 0.5)' },
-                                    { offset: 1, color: 'rgba(99, 102, 241, 0)' }
-                                ])
-                            }
-                        }]
-                    });
-                    window.addEventListener('resize', () => chart.resize());
-                };
-
-                return {
-                    topic,
-                    loading,
-                    result,
-                    analyze,
-                    renderedMarkdown,
-                    getScoreColor
-                };
-            }
-        }).mount('#app');
-    </script>
-</body>
-</html>
-    """
+    # 以 SSE 流式返回：delta 事件为模型输出片段，result 事件为解析后的完整结果
+    async def event_stream():
+        try:
+            async for event, data in stream_sentiment_analysis(request.topic):
+                if event == "delta":
+                    yield sse_event("delta", {"content": data})
+                else:
+                    yield sse_event("result", data)
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            print(f"Analyze Error: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/analyze_batch")
+async def analyze_sentiment_batch(request: BatchTopicRequest):
+    async def analyze_one(topic: str):
+        async with batch_semaphore:
+            return await get_sentiment_analysis(topic)
+
+    # 单个话题失败不影响其他话题，失败的话题在对应位置返回错误信息
+    outcomes = await asyncio.gather(
+        *[analyze_one(t) for t in request.topics], return_exceptions=True
+    )
+    results = []
+    for topic, outcome in zip(request.topics, outcomes):
+        if isinstance(outcome, HTTPException):
+            results.append({"topic": topic, "error": outcome.detail})
+        elif isinstance(outcome, Exception):
+            print(f"Batch Analyze Error ({topic}): {outcome}")
+            results.append({"topic": topic, "error": str(outcome)})
+        else:
+            results.append(outcome)
+    return MsgspecJSONResponse({"results": results})
+
+@app.on_event("startup")
+async def check_dashscope_key():
+    # 启动时发一次只生成 1 个 token 的请求，尽早发现 Key 无效等配置问题（每个 worker 每次启动计费一次）。
+    # dashscope SDK 每次调用都会新建 aiohttp 会话，这里无法为后续请求预热连接或 TLS
+    # 限时 10 秒：SDK 默认超时长达 300 秒，网络不通时会拖住 worker 启动，被 gunicorn 反复杀掉重启
+    try:
+        async with dashscope_limiter:
+            response = await asyncio.wait_for(
+                AioGeneration.call(
+                    model=dashscope.Generation.Models.qwen_plus,
+                    prompt="ping",
+                    result_format='message',
+                    max_tokens=1,
+                ),
+                timeout=10,
+            )
+        if response.status_code != HTTPStatus.OK:
+            print(f"⚠️ DashScope Key 校验失败（请检查 Key 是否有效）：{response.message}")
+    except asyncio.TimeoutError:
+        print("⚠️ DashScope Key 校验超时（10 秒），跳过校验继续启动")
+    except Exception as e:
+        print(f"⚠️ DashScope Key 校验失败：{e}")
+
+# --- 热门话题后台预刷新 ---
+async def refresh_hot_topics():
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        now = time.monotonic()
+        for key, _ in topic_counter.most_common(PREFETCH_TOP_N):
+            # 只刷新在下一轮检查前就会过期的结果，且跳过正在被用户请求分析的话题
+            cached_at = _cached_at.get(key)
+            if cached_at is not None and now - cached_at < CACHE_TTL - PREFETCH_INTERVAL:
+                continue
+            if key in _inflight:
+                continue
+            topic = _topic_names[key]
+            print(f"🔄 后台预刷新热门话题: {topic}")
+            try:
+                # 经 single-flight 登记后再分析，刷新期间到达的同一话题请求会等待本次结果；
+                # 上游调用都经过限流器，预刷新不会挤占 DashScope/Tavily 的额度上限
+                await get_sentiment_analysis(topic, refresh=True)
+            except Exception as e:
+                print(f"Refresh Error: {e}")
+
+        # 计数减半衰减，让长期无人问津的话题逐渐退出热门榜
+        for key in list(topic_counter):
+            topic_counter[key] //= 2
+            if not topic_counter[key]:
+                del topic_counter[key]
+                _topic_names.pop(key, None)
+
+_refresh_task = None
+
+@app.on_event("startup")
+async def start_refresher():
+    global _refresh_task
+    if PREFETCH_TOP_N > 0:
+        _refresh_task = asyncio.create_task(refresh_hot_topics())
+
+@app.on_event("shutdown")
+async def close_http_client():
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+    await http_client.aclose()
+
+# --- 前端页面 ---
+# 页面是纯静态文件，交给 StaticFiles 直接发送（生产环境可由 Nginx/CDN 托管 static 目录）；需在所有 API 路由之后挂载
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
 
 if __name__ == "__main__":
-    # 本地测试时可用（Render 会用 gunicorn 启动服务）
+    # 本地测试时可用（Render 会用 gunicorn 启动服务：gunicorn -c gunicorn.conf.py main:app）。
+    # 限流按 WEB_CONCURRENCY 在各进程间均分，不要直接用 gunicorn -w N 调整进程数，
+    # 应设置 WEB_CONCURRENCY=N，由 gunicorn.conf.py 据此决定 worker 数量
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+        access_log=False,
+    )